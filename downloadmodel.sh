@@ -1,8 +1,20 @@
+# Same choice as pick_quant() in smartshell.py: Q4_K_M on AVX-512,
+# Q5_K_S on AVX2 with 8 GB+ RAM, Q4_0 otherwise. SMARTSHELL_QUANT overrides.
+if [ -n "$SMARTSHELL_QUANT" ]; then
+  QUANT="$SMARTSHELL_QUANT"
+elif grep -qw avx512f /proc/cpuinfo 2>/dev/null; then
+  QUANT=Q4_K_M
+elif grep -qw avx2 /proc/cpuinfo 2>/dev/null && \
+     [ "$(awk '/^MemTotal:/ {print $2}' /proc/meminfo)" -ge $((8 * 1024 * 1024)) ]; then
+  QUANT=Q5_K_S
+else
+  QUANT=Q4_0
+fi
 ls -lh ./models ~/.config/SmartShellAI/models 2>/dev/null
-rm -f ./models/wizardcoder-python-7b-v1.0.Q4_K_M.gguf
-rm -f ~/.config/SmartShellAI/models/wizardcoder-python-7b-v1.0.Q4_K_M.gguf
+rm -f ./models/wizardcoder-python-7b-v1.0.${QUANT}.gguf
+rm -f ~/.config/SmartShellAI/models/wizardcoder-python-7b-v1.0.${QUANT}.gguf
 sudo apt install -y aria2
 mkdir -p ./models
 aria2c -x16 -s16 -k1M \
-  "https://huggingface.co/TheBloke/WizardCoder-Python-7B-V1.0-GGUF/resolve/main/wizardcoder-python-7b-v1.0.Q4_K_M.gguf" \
-  -d ./models -o wizardcoder-python-7b-v1.0.Q4_K_M.gguf
+  "https://huggingface.co/TheBloke/WizardCoder-Python-7B-V1.0-GGUF/resolve/main/wizardcoder-python-7b-v1.0.${QUANT}.gguf" \
+  -d ./models -o wizardcoder-python-7b-v1.0.${QUANT}.gguf
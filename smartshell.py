@@ -1,33 +1,61 @@
 import os
 import sys
+import io
 import json
+import atexit
+import codecs
+import locale
+import re
+import hashlib
+import importlib.util
 import time
 import queue
 import shlex
+import pickle
+import selectors
 import ctypes
+import platform
 import threading
+import concurrent.futures
+import types
 import subprocess
+import sysconfig
 import datetime as dt
 from dataclasses import dataclass
 from pathlib import Path
+from typing import List, Optional
+
+# tkinter is imported lazily by _load_tk(); only the GUI path pays for it.
+tk = messagebox = scrolledtext = None
+
+
+def _load_tk():
+    global tk, messagebox, scrolledtext
+    if tk is None:
+        import tkinter
+        from tkinter import messagebox as _messagebox, scrolledtext as _scrolledtext
+        tk, messagebox, scrolledtext = tkinter, _messagebox, _scrolledtext
+
+def _externally_managed() -> bool:
+    """True if pip would refuse to install here under PEP 668 (system Python, not a venv)."""
+    if sys.prefix != sys.base_prefix:
+        return False
+    return (Path(sysconfig.get_path("stdlib")) / "EXTERNALLY-MANAGED").exists()
 
-import tkinter as tk
-from tkinter import messagebox, scrolledtext
 
 def _pip_install(pkg: str):
-    try:
-        subprocess.check_call([sys.executable, "-m", "pip", "install", "--quiet",
-                               "--break-system-packages", pkg])
-    except subprocess.CalledProcessError:
-        subprocess.check_call([sys.executable, "-m", "pip", "install", "--quiet", pkg])
+    # Pick the flags up front so pip starts only once.
+    args = [sys.executable, "-m", "pip", "install", "--quiet"]
+    if _externally_managed():
+        args.append("--break-system-packages")
+    subprocess.run(args + [pkg], check=True)
 
 
 def _ensure_dependencies(packages):
     """Ensure that required Python packages are installed. Uses pip to install missing packages automatically."""
     for pkg in packages:
-        try:
-            __import__(pkg)
-        except ModuleNotFoundError:
+        # find_spec only consults the import path; it doesn't execute the package.
+        if importlib.util.find_spec(pkg) is None:
             _pip_install(pkg)
 
 
@@ -35,13 +63,13 @@ def _ensure_dependencies(packages):
 _ensure_dependencies(["llama_cpp", "diskcache"])
 
 
-LLAMA_AVAILABLE = False
+# The real import happens in ensure_model_loaded(), after wire_llama_lib() has run.
+LLAMA_AVAILABLE = importlib.util.find_spec("llama_cpp") is not None
+
 try:
-    from llama_cpp import Llama 
-    LLAMA_AVAILABLE = True
+    import diskcache
 except Exception:
-    Llama = None  
-    LLAMA_AVAILABLE = False
+    diskcache = None
 
 
 
@@ -76,13 +104,148 @@ def user_logs_dir() -> Path:
     return d
 
 
+def models_dir() -> Path:
+    d = app_dir() / "models"
+    if d.is_dir():
+        return d
+    d = user_config_dir() / "models"
+    d.mkdir(parents=True, exist_ok=True)
+    return d
+
+
+MODEL_BASENAME = "wizardcoder-python-7b-v1.0"
+QUANTS = ("Q4_0", "Q5_K_S", "Q4_K_M")
+
+
+def _cpu_flags() -> set:
+    """Return the CPU feature flags from /proc/cpuinfo (empty set where unavailable)."""
+    try:
+        with open("/proc/cpuinfo", encoding="utf-8", errors="ignore") as f:
+            for line in f:
+                if line.startswith("flags"):
+                    return set(line.split(":", 1)[1].split())
+    except OSError:
+        pass
+    return set()
+
+
+def _total_ram_gb() -> float:
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / (1024 ** 3)
+    except (AttributeError, ValueError, OSError):
+        return 0.0
+
+
+def pick_quant() -> str:
+    """
+    Choose the GGUF quantization for this host.
+
+    K-quants cost more dequant work per weight, so only AVX-512 machines get Q4_K_M;
+    AVX2 with enough RAM gets Q5_K_S, everything else the cheap legacy Q4_0.
+    SMARTSHELL_QUANT overrides the detection.
+    """
+    forced = os.environ.get("SMARTSHELL_QUANT")
+    if forced:
+        return forced
+    flags = _cpu_flags()
+    if "avx512f" in flags:
+        return "Q4_K_M"
+    if "avx2" in flags and _total_ram_gb() >= 8:
+        return "Q5_K_S"
+    return "Q4_0"
+
+
+def _installed_or_picked_quant() -> str:
+    """
+    pick_quant(), unless only a different quant is already in models_dir().
+
+    Reusing an installed model avoids a second multi-GB download, e.g. for the
+    Q4_K_M file older versions fetched.
+    """
+    picked = pick_quant()
+    if os.environ.get("SMARTSHELL_QUANT"):
+        return picked
+    d = models_dir()
+    if (d / f"{MODEL_BASENAME}.{picked}.gguf").exists():
+        return picked
+    for quant in QUANTS:
+        if (d / f"{MODEL_BASENAME}.{quant}.gguf").exists():
+            return quant
+    return picked
+
+
+def _physical_cpus() -> list:
+    """
+    One logical CPU per physical core among the CPUs this process may use.
+
+    Linux only (sysfs topology); elsewhere returns [] and callers fall back to os.cpu_count().
+    """
+    if not hasattr(os, "sched_getaffinity"):
+        return []
+    picked, seen = [], set()
+    for cpu in sorted(os.sched_getaffinity(0)):
+        path = f"/sys/devices/system/cpu/cpu{cpu}/topology/thread_siblings_list"
+        try:
+            with open(path, encoding="ascii") as f:
+                siblings = f.read().strip()
+        except OSError:
+            return []
+        if siblings not in seen:
+            seen.add(siblings)
+            picked.append(cpu)
+    return picked
+
+
+
+
+def _has_gpu() -> bool:
+    """Cheap check for a CUDA/ROCm driver or Apple Metal, without importing llama_cpp."""
+    if sys.platform == "darwin" and platform.machine() == "arm64":
+        return True
+    libs = ("nvcuda.dll",) if os.name == "nt" else ("libcuda.so.1", "libamdhip64.so")
+    for name in libs:
+        try:
+            ctypes.CDLL(name)
+            return True
+        except OSError:
+            continue
+    return False
+
+
+def _default_gpu_layers() -> int:
+    forced = os.environ.get("SMARTSHELL_GPU_LAYERS")
+    if forced:
+        try:
+            return int(forced)
+        except ValueError:
+            return 0
+    return -1 if _has_gpu() else 0
+
+
 @dataclass
 class Settings:
-    model_name: str = "wizardcoder-python-7b-v1.0.Q4_K_M.gguf"
-    ctx: int = 2048
+    model_name: str = ""
+    quant: str = ""
+    ctx: int = 768  # ~150-token SYSTEM_PROMPT + user prompt + generated command, with headroom
     timeout_sec: int = 600  
     use_shell: bool = True 
     os_hint: str = ""       
+    # None: one thread per physical core, resolved on the llama thread (see _init_llm_thread).
+    n_threads: Optional[int] = None
+    n_threads_batch: Optional[int] = None
+    n_batch: int = 512
+    n_gpu_layers: Optional[int] = None  # None: detect on first model load (see _default_gpu_layers)
+    use_mmap: bool = True
+    use_mlock: bool = False
+    pin_threads: bool = True
+    # Overrides the SHA256 Hugging Face publishes for the model file (see _remote_sha256).
+    model_sha256: str = os.environ.get("SMARTSHELL_MODEL_SHA256", "")
+
+    def __post_init__(self):
+        if not self.quant:
+            self.quant = _installed_or_picked_quant()
+        if not self.model_name:
+            self.model_name = f"{MODEL_BASENAME}.{self.quant}.gguf"
 
 
 SETTINGS = Settings()
@@ -90,7 +253,7 @@ SETTINGS = Settings()
 
 MODEL_URL = (
     "https://huggingface.co/TheBloke/WizardCoder-Python-7B-V1.0-GGUF/"
-    "resolve/main/wizardcoder-python-7b-v1.0.Q4_K_M.gguf"
+    f"resolve/main/{SETTINGS.model_name}"
 )
 
 
@@ -100,23 +263,24 @@ def wire_llama_lib():
     """Discover the llama-cpp shared library so the import doesn't crash. It's ok if this fails; we have fallback rules."""
     if os.environ.get("LLAMA_CPP_LIB"):
         return
-    candidates = [
-        bundle_dir() / "llama.dll",
-        bundle_dir() / "libllama.so",
-        bundle_dir() / "libllama.dylib",
-        bundle_dir() / "llama_cpp" / "lib" / "llama.dll",
-        bundle_dir() / "llama_cpp" / "lib" / "libllama.so",
-        bundle_dir() / "llama_cpp" / "lib" / "libllama.dylib",
-    ]
-    for p in candidates:
-        if p.exists():
-            os.environ["LLAMA_CPP_LIB"] = str(p)
-            if os.name == "nt" and hasattr(os, "add_dll_directory"):
-                try:
-                    os.add_dll_directory(str(p.parent))
-                except Exception:
-                    pass
-            return
+    # Two directory listings instead of a stat() per candidate; order keeps the bundle root first.
+    wanted = ("llama.dll", "libllama.so", "libllama.dylib")
+    for base in (bundle_dir(), bundle_dir() / "llama_cpp" / "lib"):
+        try:
+            with os.scandir(base) as it:
+                names = {entry.name for entry in it}
+        except OSError:
+            continue
+        for name in wanted:
+            if name in names:
+                p = base / name
+                os.environ["LLAMA_CPP_LIB"] = str(p)
+                if os.name == "nt" and hasattr(os, "add_dll_directory"):
+                    try:
+                        os.add_dll_directory(str(p.parent))
+                    except Exception:
+                        pass
+                return
 
 
 wire_llama_lib()
@@ -124,43 +288,106 @@ wire_llama_lib()
 
 
 
-def models_dir() -> Path:
-    d = app_dir() / "models"
-    if d.is_dir():
-        return d
-    d = user_config_dir() / "models"
-    d.mkdir(parents=True, exist_ok=True)
-    return d
-
-
 def model_path() -> Path:
     return models_dir() / SETTINGS.model_name
 
 
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+def _hash_file(path: Path, h):
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+            h.update(chunk)
+
+
+def _remote_sha256() -> str:
+    """
+    SHA256 of the file behind MODEL_URL, or "" if the server doesn't say.
+
+    Hugging Face puts it in X-Linked-Etag on the resolve/ redirect, so the
+    redirect is not followed here.
+    """
+    import urllib.error
+    import urllib.request
+
+    class _NoRedirect(urllib.request.HTTPRedirectHandler):
+        def redirect_request(self, *args, **kwargs):
+            return None
+
+    req = urllib.request.Request(MODEL_URL, method="HEAD")
+    try:
+        with urllib.request.build_opener(_NoRedirect).open(req, timeout=30) as response:
+            headers = response.headers
+    except urllib.error.HTTPError as ex:
+        headers = ex.headers
+    except Exception:
+        return ""
+    etag = (headers.get("X-Linked-Etag") or "").strip()
+    if etag.startswith("W/"):
+        etag = etag[2:]
+    etag = etag.strip('"').lower()
+    return etag if re.fullmatch(r"[0-9a-f]{64}", etag) else ""
+
+
+def _finish_download(part: Path, dest: Path, h, expected: str):
+    """Move a completed download into place, checking it against the expected SHA256 if known."""
+    if expected and h.hexdigest() != expected:
+        part.unlink(missing_ok=True)
+        raise ValueError(f"SHA256 mismatch for {dest.name}; the corrupt download was removed.")
+    os.replace(part, dest)
+
+
 def download_model() -> bool:
     """
     Download the GGUF model file if it does not already exist.
 
     Returns True on success, False on failure. Uses urllib to avoid extra deps.
+    Bytes land in a ".part" file first; an interrupted download is resumed
+    with an HTTP Range request on the next attempt. The SHA256 is computed
+    while the bytes are written, so verification needs no second pass.
     """
     dest = model_path()
+    part = dest.with_suffix(".part")
     try:
         dest.parent.mkdir(parents=True, exist_ok=True)
+        import urllib.error
         import urllib.request
 
-        with urllib.request.urlopen(MODEL_URL) as response, open(dest, "wb") as out_file:
-            total_size = int(response.getheader("Content-Length", 0) or 0)
-            downloaded = 0
-            chunk_size = 8192
-            while True:
-                chunk = response.read(chunk_size)
-                if not chunk:
-                    break
-                out_file.write(chunk)
-                downloaded += len(chunk)
+        expected = SETTINGS.model_sha256.strip().lower() or _remote_sha256()
+        h = hashlib.sha256()
+        have = part.stat().st_size if part.exists() else 0
+        headers = {"Range": f"bytes={have}-"} if have else {}
+        req = urllib.request.Request(MODEL_URL, headers=headers)
+        try:
+            response = urllib.request.urlopen(req)
+        except urllib.error.HTTPError as ex:
+            # 416: the partial file claims to hold every byte; only trust it if it hashes right.
+            if have and ex.code == 416:
+                if not expected:
+                    part.unlink(missing_ok=True)
+                    raise ValueError(f"Could not verify the partial download of {dest.name}; it was removed.")
+                _hash_file(part, h)
+                _finish_download(part, dest, h, expected)
+                return True
+            raise
+        with response:
+            # Servers that ignore Range answer 200 with the whole file: start over.
+            mode = "ab" if have and response.status == 206 else "wb"
+            if mode == "ab":
+                _hash_file(part, h)
+            with open(part, mode) as out_file:
+                while True:
+                    chunk = response.read(DOWNLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    h.update(chunk)
+                    out_file.write(chunk)
+        _finish_download(part, dest, h, expected)
         return True
     except Exception as ex:
         try:
+            _load_tk()
             messagebox.showerror(
                 "SmartShell AI",
                 f"Failed to download model from {MODEL_URL}:\n{ex}",
@@ -174,7 +401,63 @@ def download_model() -> bool:
 
 _LLM = None
 _LLM_LOCK = threading.Lock()
+_PINNED_CPUS = 0
+
+
+def _init_llm_thread():
+    """
+    Resolve the llama thread counts and pin the llama thread to one CPU per physical core.
+
+    Runs once, on first model use, so rule-only sessions never read the sysfs topology.
+    ggml workers inherit the affinity of the thread that starts them, so all model
+    calls go through this one thread and the GUI thread stays unpinned.
+    SMT siblings share the same FMA units, hence one thread per physical core.
+    """
+    global _PINNED_CPUS
+    physical = _physical_cpus()
+    if SETTINGS.n_threads is None:
+        SETTINGS.n_threads = len(physical) or max(1, (os.cpu_count() or 2) // 2)
+    if SETTINGS.n_threads_batch is None:
+        SETTINGS.n_threads_batch = len(physical) or max(1, os.cpu_count() or 1)
+    if not (SETTINGS.pin_threads and physical):
+        return
+    cpus = physical[:SETTINGS.n_threads]
+    try:
+        os.sched_setaffinity(0, cpus)
+        _PINNED_CPUS = len(cpus)
+    except OSError:
+        pass
+
+
+def _cap_to_pinned(n: int) -> int:
+    # More ggml threads than pinned CPUs would just spin at the barriers.
+    return min(n, _PINNED_CPUS) if _PINNED_CPUS else n
+
+
+_LLM_EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+    max_workers=1, thread_name_prefix="llama", initializer=_init_llm_thread
+)
+
+
+def _on_llm_thread(fn, *args, **kwargs):
+    return _LLM_EXECUTOR.submit(fn, *args, **kwargs).result()
+
+
 TRANSLATE_MODE = "rule"  
+LLM_CACHE_EXPIRE_SEC = 30 * 86400
+
+
+def _open_llm_cache():
+    """Open the on-disk translation cache. Returns None if diskcache is unusable."""
+    if diskcache is None:
+        return None
+    try:
+        return diskcache.Cache(str(user_config_dir() / "llm_cache"))
+    except Exception:
+        return None
+
+
+_LLM_CACHE = _open_llm_cache()
 
 def _current_os_hint() -> str:
     if SETTINGS.os_hint:
@@ -195,12 +478,90 @@ SYSTEM_PROMPT = (
 )
 
 
-def ensure_model_loaded():
+def _prefix_state_path() -> Path:
+    import llama_cpp
+
+    # The llama_cpp version is in the key because the pickled state layout isn't stable across releases.
+    key = hashlib.blake2b(
+        f"{llama_cpp.__version__}|{SETTINGS.model_name}|{SETTINGS.ctx}|{SYSTEM_PROMPT}".encode("utf-8")
+    ).hexdigest()[:32]
+    return user_config_dir() / f"kv_cache_{key}.bin"
+
+
+def _load_prefix_state():
+    """Load the prefilled SYSTEM_PROMPT state saved by an earlier run, or None."""
+    path = _prefix_state_path()
+    if not path.exists():
+        return None
+    try:
+        with path.open("rb") as f:
+            state = pickle.load(f)
+        _LLM.load_state(state)
+        return state
+    except Exception:
+        # load_state may have set n_tokens/input_ids before failing; start from a clean context.
+        _LLM.reset()
+        path.unlink(missing_ok=True)
+        return None
+
+
+def _store_prefix_state(state):
+    path = _prefix_state_path()
+    tmp = path.with_suffix(".tmp")
+    try:
+        with tmp.open("wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+    except Exception:
+        return
+    # Snapshots are tens of MB; keep only the one matching the current key.
+    for old in path.parent.glob("kv_cache_*.bin"):
+        if old != path:
+            old.unlink(missing_ok=True)
+
+
+def _build_llm(Llama, p: Path):
     global _LLM
+    if SETTINGS.n_gpu_layers is None:
+        # Resolved here, not at import, so cold start doesn't pay for loading GPU drivers.
+        SETTINGS.n_gpu_layers = _default_gpu_layers()
+    kwargs = dict(
+        model_path=str(p),
+        n_ctx=SETTINGS.ctx,
+        n_threads=_cap_to_pinned(SETTINGS.n_threads),
+        n_threads_batch=_cap_to_pinned(SETTINGS.n_threads_batch),
+        n_batch=SETTINGS.n_batch,
+        n_gpu_layers=SETTINGS.n_gpu_layers,
+        use_mmap=SETTINGS.use_mmap,
+        use_mlock=SETTINGS.use_mlock,
+        logits_all=False,
+        verbose=False,
+    )
+    try:
+        _LLM = Llama(**kwargs)
+    except Exception:
+        if not SETTINGS.n_gpu_layers:
+            raise
+        # GPU offload failed (CPU-only wheel, out of VRAM, ...): retry on the CPU.
+        SETTINGS.n_gpu_layers = 0
+        _LLM = Llama(**{**kwargs, "n_gpu_layers": 0})
+    # Prefill the fixed system prompt once (or restore it from disk); translations rewind to it.
+    if _load_prefix_state() is None:
+        _LLM.eval(_LLM.tokenize(SYSTEM_PROMPT.encode("utf-8")))
+        _store_prefix_state(_LLM.save_state())
+
+
+def ensure_model_loaded():
+    global LLAMA_AVAILABLE
     if not LLAMA_AVAILABLE:
         raise RuntimeError("llama_cpp is not available. Using fallback rules.")
     with _LLM_LOCK:
         if _LLM is None:
+            try:
+                from llama_cpp import Llama
+            except Exception as ex:
+                LLAMA_AVAILABLE = False
+                raise RuntimeError(f"llama_cpp failed to load ({ex}). Using fallback rules.")
             p = model_path()
             if not p.exists():
 
@@ -210,47 +571,115 @@ def ensure_model_loaded():
                         f"Model missing and download failed: {p}\n"
                         f"Place the .gguf model in '{models_dir()}' or check internet connection."
                     )
-            _LLM = Llama(model_path=str(p), n_ctx=SETTINGS.ctx)
+            # Built on the llama thread so ggml's workers inherit its core pinning.
+            _on_llm_thread(_build_llm, Llama, p)
+
+
+_FENCE_OPEN = re.compile(r"\s*```[\w+-]*[ \t]*\n")
+_FENCE_PARTIAL = re.compile(r"\s*`{1,3}[\w+-]*[ \t]*")
+
+
+def _strip_open_fence(text: str):
+    """
+    Drop a leading ```lang line so WizardCoder's fenced answers aren't cut to "".
+
+    Returns None while the output could still be an unfinished opening fence.
+    """
+    m = _FENCE_OPEN.match(text)
+    if m:
+        return text[m.end():]
+    if _FENCE_PARTIAL.fullmatch(text):
+        return None
+    return text
+
+
+def _llm_complete(suffix: str, max_tokens: int, stop: List[str]) -> str:
+    """Generate a continuation of SYSTEM_PROMPT + suffix, reusing the KV cache of the shared prefix."""
+    assert _LLM is not None
+    with _LLM_LOCK:
+        # Tokenize the whole prompt so the model sees exactly SYSTEM_PROMPT + suffix,
+        # then rewind to the tokens already in the KV cache (at least SYSTEM_PROMPT)
+        # and eval only the rest; eval() drops KV entries past n_tokens itself.
+        tokens = _LLM.tokenize((SYSTEM_PROMPT + suffix).encode("utf-8"))
+        cached = _LLM.input_ids[:_LLM.n_tokens]
+        keep, limit = 0, min(len(cached), len(tokens) - 1)
+        while keep < limit and cached[keep] == tokens[keep]:
+            keep += 1
+        _LLM.n_tokens = keep
+        _LLM.eval(tokens[keep:])
+        eos = _LLM.token_eos()
+        out = b""
+        for _ in range(max_tokens):
+            tok = _LLM.sample(temp=0.2, top_p=0.95)
+            if tok == eos:
+                break
+            out += _LLM.detokenize([tok])
+            text = _strip_open_fence(out.decode("utf-8", errors="ignore"))
+            if text is not None:
+                hits = [text.find(s) for s in stop if s in text]
+                if hits:
+                    return text[:min(hits)]
+            _LLM.eval([tok])
+        return _strip_open_fence(out.decode("utf-8", errors="ignore")) or ""
+
+
+def _llm_cache_key(user_prompt: str) -> str:
+    # Model and SYSTEM_PROMPT are part of the key so changing either never serves stale answers.
+    # No case folding: shell commands are case-sensitive ("mkdir MyProj" != "mkdir myproj").
+    raw = repr((SETTINGS.model_name, SYSTEM_PROMPT, _current_os_hint(), user_prompt.strip()))
+    return hashlib.blake2b(raw.encode("utf-8")).hexdigest()
 
 
 def llm_translate(user_prompt: str) -> str:
     global TRANSLATE_MODE
+    key = _llm_cache_key(user_prompt)
+    if _LLM_CACHE is not None:
+        cached = _LLM_CACHE.get(key)
+        if cached:
+            TRANSLATE_MODE = "llm"
+            return cached
     ensure_model_loaded()
-    assert _LLM is not None
-    text = f"{SYSTEM_PROMPT}\nUser: {user_prompt}\nCommand:"
-    out = _LLM(
-        prompt=text,
-        max_tokens=120,
-        stop=["\n", "</s>", "User:", "Command:"],
-        temperature=0.2,
-        top_p=0.95,
+    out = _on_llm_thread(
+        _llm_complete,
+        f"\nUser: {user_prompt}\nCommand:",
+        max_tokens=48,
+        stop=["\n", "\r", "</s>", "User:", "Command:", "```"],
     )
-    cmd = (out.get("choices", [{}])[0].get("text") or "").strip()
-
+    cmd = out.strip()
+    if not cmd:
+        # translate() falls back to the rule table; empty answers are never cached.
+        raise RuntimeError("empty LLM completion")
     cmd = cmd.splitlines()[0].strip()
     if cmd.startswith("`") and cmd.endswith("`"):
         cmd = cmd[1:-1].strip()
+    if cmd and _LLM_CACHE is not None:
+        _LLM_CACHE.set(key, cmd, expire=LLM_CACHE_EXPIRE_SEC)
     TRANSLATE_MODE = "llm"
     return cmd
 
 
+# Read-only so the table built at import can't be mutated at runtime.
+_RULES = types.MappingProxyType({
+    "κάνε update": "sudo apt update && sudo apt upgrade -y",
+    "κανε update": "sudo apt update && sudo apt upgrade -y",
+    "άδειασε την cache": "sudo apt clean",
+    "αδειασε την cache": "sudo apt clean",
+    "ip": "ip a",
+    "upgrade": "sudo apt update && sudo apt upgrade -y",
+    "install vlc": "sudo apt install -y vlc",
+    "list files": "ls -la",
+    "ping google": "ping -c 4 google.com",
+    "check my ip": "ip a",
+    "my ip": "ip a",
+})
+
+
 def rule_based_translate(prompt: str) -> str:
     global TRANSLATE_MODE
     low = prompt.strip().lower()
-    rules = {
-        "κάνε update": "sudo apt update && sudo apt upgrade -y",
-        "κανε update": "sudo apt update && sudo apt upgrade -y",
-        "άδειασε την cache": "sudo apt clean",
-        "αδειασε την cache": "sudo apt clean",
-        "ip": "ip a",
-        "upgrade": "sudo apt update && sudo apt upgrade -y",
-        "install vlc": "sudo apt install -y vlc",
-        "list files": "ls -la",
-        "ping google": "ping -c 4 google.com",
-        "check my ip": "ip a",
-        "my ip": "ip a",
-    }
-    for k, v in rules.items():
+    # Earlier keys win. A plain substring loop over this small table beats a regex
+    # that has to preserve the same priority.
+    for k, v in _RULES.items():
         if k in low:
             TRANSLATE_MODE = "rule"
             return v
@@ -273,15 +702,81 @@ def translate(prompt: str) -> str:
 
 
 
+READ_CHUNK_SIZE = 65536
+FLUSH_BYTES = 16 * 1024
+FLUSH_INTERVAL_SEC = 0.05
+IDLE_WAIT_SEC = 0.2
+
+
+class _PipeReader:
+    """
+    Read a pipe with a bounded wait so callers can check cancel/timeout while the child is silent.
+
+    read() returns the bytes available, b"" at EOF, or None if nothing arrived within the wait.
+    POSIX uses a selector on a non-blocking fd; Windows can't select() on pipes,
+    so a daemon thread does blocking reads into a queue instead.
+    """
+
+    def __init__(self, fd: int):
+        self.fd = fd
+        if os.name == "nt":
+            self._sel = None
+            self._q: "queue.Queue[bytes]" = queue.Queue()
+            threading.Thread(target=self._pump, daemon=True).start()
+        else:
+            os.set_blocking(fd, False)
+            self._sel = selectors.DefaultSelector()
+            self._sel.register(fd, selectors.EVENT_READ)
+
+    def _pump(self):
+        while True:
+            try:
+                data = os.read(self.fd, READ_CHUNK_SIZE)
+            except OSError:
+                data = b""
+            self._q.put(data)
+            if not data:
+                return
+
+    def read(self, wait: float):
+        if self._sel is None:
+            try:
+                return self._q.get(timeout=wait)
+            except queue.Empty:
+                return None
+        if not self._sel.select(wait):
+            return None
+        try:
+            return os.read(self.fd, READ_CHUNK_SIZE)
+        except BlockingIOError:
+            return None
+
+    def close(self):
+        if self._sel is not None:
+            self._sel.close()
+
+
 class Runner:
-    def __init__(self, timeout_sec: int = 600, use_shell: bool = True):
+    def __init__(self, timeout_sec: int = 600, use_shell: bool = True, on_output=None):
         self.timeout = timeout_sec
         self.use_shell = use_shell
         self.proc: subprocess.Popen | None = None
         self.output_q: "queue.Queue[str]" = queue.Queue()
+        self.on_output = on_output
         self._cancel = threading.Event()
 
+    def _emit(self, text: str):
+        """Queue output and wake the consumer (called from the worker thread)."""
+        self.output_q.put(text)
+        if self.on_output is not None:
+            try:
+                self.on_output()
+            except Exception:
+                pass
+
     def run_async(self, cmd: str, on_done):
+        # A previous cancel or timeout must not stop the next command.
+        self._cancel.clear()
         t = threading.Thread(target=self._worker, args=(cmd, on_done), daemon=True)
         t.start()
 
@@ -297,7 +792,7 @@ class Runner:
                 pass
 
     def _worker(self, cmd: str, on_done):
-        start = time.time()
+        start = time.monotonic()
         try:
             popen_cmd = cmd if self.use_shell else shlex.split(cmd)
             self.proc = subprocess.Popen(
@@ -305,42 +800,104 @@ class Runner:
                 shell=self.use_shell,
                 stdout=subprocess.PIPE,
                 stderr=subprocess.STDOUT,
-                text=True,
-                bufsize=1,
-                universal_newlines=True,
+                bufsize=0,
             )
             assert self.proc.stdout is not None
-            for line in self.proc.stdout:
-                if self._cancel.is_set():
-                    break
-                self.output_q.put(line)
-                if (time.time() - start) > self.timeout:
-                    self.output_q.put("\n[!] Timeout reached. Terminating...\n")
-                    self.cancel()
-                    break
+            reader = _PipeReader(self.proc.stdout.fileno())
+            # Same newline handling as text mode: \r\n and bare \r become \n, and a
+            # trailing \r is held back until the next read shows whether \n follows.
+            decoder = io.IncrementalNewlineDecoder(
+                codecs.getincrementaldecoder(locale.getpreferredencoding(False))(errors="replace"),
+                translate=True,
+            )
+            batch: list[str] = []
+            batch_len = 0
+            last_flush = time.monotonic()
+            try:
+                while True:
+                    # Wait less while output is pending so a held-back batch is flushed on time.
+                    data = reader.read(FLUSH_INTERVAL_SEC if batch else IDLE_WAIT_SEC)
+                    if self._cancel.is_set():
+                        break
+                    if data is not None:
+                        text = decoder.decode(data, final=not data)
+                        if text:
+                            batch.append(text)
+                            batch_len += len(text)
+                    now = time.monotonic()
+                    if batch and (data == b"" or batch_len >= FLUSH_BYTES
+                                  or now - last_flush >= FLUSH_INTERVAL_SEC):
+                        self._emit("".join(batch))
+                        batch.clear()
+                        batch_len = 0
+                        last_flush = now
+                    if data == b"":
+                        break
+                    if (now - start) > self.timeout:
+                        self._emit("\n[!] Timeout reached. Terminating...\n")
+                        self.cancel()
+                        break
+            finally:
+                reader.close()
             code = self.proc.wait(timeout=5)
             on_done(code)
         except subprocess.TimeoutExpired:
-            self.output_q.put("\n[!] Process hang; killed.\n")
+            self._emit("\n[!] Process hang; killed.\n")
             self.cancel()
             on_done(-1)
         except Exception as e:
-            self.output_q.put(f"\n[!] Error: {e}\n")
+            self._emit(f"\n[!] Error: {e}\n")
             on_done(-2)
 
 
 
 
+try:
+    import orjson
+
+    def _dumps(obj) -> str:
+        return orjson.dumps(obj).decode("utf-8")
+except ImportError:
+    _dumps = json.JSONEncoder(ensure_ascii=False).encode
+
+
+_log_fh = None
+_log_date = None
+_LOG_LOCK = threading.Lock()
+
+
+def _close_log():
+    global _log_fh
+    with _LOG_LOCK:
+        if _log_fh is not None:
+            _log_fh.close()
+            _log_fh = None
+
+
+atexit.register(_close_log)
+
+
 def log_entry(entry: dict):
-    path = user_logs_dir() / f"history_{dt.date.today().isoformat()}.jsonl"
-    with path.open("a", encoding="utf-8") as f:
-        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    """Append one record to today's JSONL history, keeping the file open between calls."""
+    global _log_fh, _log_date
+    today = dt.date.today()
+    with _LOG_LOCK:
+        if _log_fh is None or _log_date != today:
+            if _log_fh is not None:
+                _log_fh.close()
+            path = user_logs_dir() / f"history_{today.isoformat()}.jsonl"
+            _log_fh = path.open("a", encoding="utf-8", buffering=64 * 1024)
+            _log_date = today
+        _log_fh.write(_dumps(entry))
+        _log_fh.write("\n")
+        # One write() per record so a crash never loses history; the handle stays open.
+        _log_fh.flush()
 
 
 
 
 class SmartShellGUI:
-    def __init__(self, root: tk.Tk):
+    def __init__(self, root: "tk.Tk"):
         self.root = root
         self.root.title("SmartShell AI")
         self.root.configure(bg="#1e1e1e")
@@ -382,8 +939,10 @@ class SmartShellGUI:
         self.status = tk.Label(root, text="Ready.", bg="#1e1e1e", fg="#aaa", anchor="w")
         self.status.pack(fill=tk.X, padx=10, pady=(0, 10))
 
-        self.runner = Runner(timeout_sec=SETTINGS.timeout_sec, use_shell=SETTINGS.use_shell)
-        self._poll_output()
+        # The worker fires <<RunnerOutput>> when it queues text, so an idle window never wakes up.
+        self.root.bind("<<RunnerOutput>>", self._drain_queue)
+        self.runner = Runner(timeout_sec=SETTINGS.timeout_sec, use_shell=SETTINGS.use_shell,
+                             on_output=lambda: self.root.event_generate("<<RunnerOutput>>", when="tail"))
 
 
     def append(self, text: str):
@@ -451,19 +1010,21 @@ class SmartShellGUI:
         self.set_status("Cancelling…")
 
 
-    def _poll_output(self):
+    def _drain_queue(self, _event=None):
+        chunks = []
         try:
             while True:
-                line = self.runner.output_q.get_nowait()
-                self.append(line)
+                chunks.append(self.runner.output_q.get_nowait())
         except queue.Empty:
             pass
-        self.root.after(60, self._poll_output)
+        if chunks:
+            self.append("".join(chunks))
 
 
 
 
 def main():
+    _load_tk()
     root = tk.Tk()
     app = SmartShellGUI(root)
     root.mainloop()